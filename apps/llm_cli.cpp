@@ -231,6 +231,425 @@ static std::string load_context_from_sqlite_by_ids(
     return ctx.str();
 }
 
+// ---------- one generation (fresh context per call) ----------
+struct GenParams
+{
+    int n_predict;
+    int n_ctx;
+    int n_batch;
+    float temp;
+    int top_k;
+    float top_p;
+    int seed;
+    bool debug_prompt;
+    std::vector<std::string> stops;
+};
+
+// 返回 0 表示成功，answer 为后处理后的输出；否则返回与进程退出码一致的错误码
+static int generate_answer(
+    llama_model *model,
+    const GenParams &gp,
+    const std::string &user_question,
+    const std::string &evidence,
+    std::string &answer)
+{
+    // 3) context
+    llama_context_params cparams = llama_context_default_params();
+    cparams.n_ctx = gp.n_ctx;
+    cparams.n_batch = gp.n_batch;
+
+    llama_context *ctx = llama_new_context_with_model(model, cparams);
+    if (!ctx)
+    {
+        std::cerr << "Failed to create context\n";
+        return 3;
+    }
+
+    // 4) system + user prompt (注入证据)
+    std::string system = u8"你是计算机专业课程助教，只能用中文回答。"
+                         u8"输出必须满足："
+                         u8"（1）只输出一句话；（2）必须是定义式；（3）不得出现“好的/请/根据/无法/示例”等套话；"
+                         u8"（4）不得输出换行；（5）不得输出多余标点。";
+
+    std::string user;
+    if (!evidence.empty())
+    {
+        user = u8"以下是检索到的资料证据（回答必须基于这些证据，且不得编造）：\n";
+        user += evidence;
+        user += u8"\n请按以下格式回答：\n【定义】LR(0)项目集：<一句话定义>。\n问题：";
+        user += user_question;
+    }
+    else
+    {
+        user = u8"请按以下格式回答：\n【定义】LR(0)项目集：<一句话定义>。\n问题：";
+        user += user_question;
+    }
+
+    std::vector<llama_chat_message> msgs;
+    msgs.push_back({"system", system.c_str()});
+    msgs.push_back({"user", user.c_str()});
+
+    std::string prompt;
+    prompt.resize(64 * 1024);
+
+    int pn = llama_chat_apply_template(
+        nullptr, // use template stored in GGUF metadata
+        msgs.data(),
+        (int)msgs.size(),
+        true, // add assistant prefix
+        prompt.data(),
+        (int)prompt.size());
+    if (pn < 0)
+    {
+        std::cerr << "llama_chat_apply_template failed\n";
+        llama_free(ctx);
+        return 6;
+    }
+    prompt.resize(pn);
+
+    if (gp.debug_prompt)
+    {
+        std::cerr << "\n[DEBUG PROMPT]\n"
+                  << prompt.substr(0, 1200) << "\n[/DEBUG PROMPT]\n";
+    }
+
+    // 5) tokenize
+    const llama_vocab *vocab = llama_model_get_vocab(model);
+
+    std::vector<llama_token> tokens;
+    tokens.resize(prompt.size() + 64);
+
+    int n_prompt = llama_tokenize(
+        vocab,
+        prompt.c_str(),
+        (int)prompt.size(),
+        tokens.data(),
+        (int)tokens.size(),
+        true, // add_special
+        false // parse_special
+    );
+    if (n_prompt < 0)
+    {
+        std::cerr << "Tokenize failed\n";
+        llama_free(ctx);
+        return 4;
+    }
+    tokens.resize(n_prompt);
+
+    // 6) eval prompt
+    llama_batch batch = llama_batch_init(gp.n_batch, 0, 1);
+    batch.n_tokens = 0;
+
+    for (int i = 0; i < (int)tokens.size(); ++i)
+    {
+        batch.token[batch.n_tokens] = tokens[i];
+        batch.pos[batch.n_tokens] = i;
+        batch.seq_id[batch.n_tokens][0] = 0;
+        batch.n_seq_id[batch.n_tokens] = 1;
+        batch.logits[batch.n_tokens] = false;
+        batch.n_tokens++;
+    }
+    batch.logits[batch.n_tokens - 1] = true;
+
+    if (llama_decode(ctx, batch) != 0)
+    {
+        std::cerr << "llama_decode(prompt) failed\n";
+        llama_batch_free(batch);
+        llama_free(ctx);
+        return 5;
+    }
+
+    // 7) sampler chain
+    llama_sampler *smpl = llama_sampler_chain_init(llama_sampler_chain_default_params());
+    llama_sampler_chain_add(smpl, llama_sampler_init_top_k(gp.top_k));
+    llama_sampler_chain_add(smpl, llama_sampler_init_top_p(gp.top_p, 1));
+    llama_sampler_chain_add(smpl, llama_sampler_init_temp(gp.temp));
+    llama_sampler_chain_add(smpl, llama_sampler_init_dist((uint32_t)gp.seed));
+
+    // 8) generation
+    int n_cur = (int)tokens.size();
+    std::string out;
+    out.reserve((size_t)gp.n_predict * 6);
+
+    for (int i = 0; i < gp.n_predict; ++i)
+    {
+        llama_token id = llama_sampler_sample(smpl, ctx, -1);
+        llama_sampler_accept(smpl, id);
+
+        if (id == llama_token_eos(vocab))
+            break;
+
+        char buf[4096];
+        int nb = llama_token_to_piece(vocab, id, buf, (int)sizeof(buf), 0, true);
+        if (nb <= 0)
+            break;
+
+        out.append(buf, buf + nb);
+
+        if (ends_with_any(out, gp.stops))
+        {
+            trim_at_stop_first_occurrence(out, gp.stops);
+            break;
+        }
+
+        batch.n_tokens = 0;
+        batch.token[batch.n_tokens] = id;
+        batch.pos[batch.n_tokens] = n_cur++;
+        batch.seq_id[batch.n_tokens][0] = 0;
+        batch.n_seq_id[batch.n_tokens] = 1;
+        batch.logits[batch.n_tokens] = true;
+        batch.n_tokens++;
+
+        if (llama_decode(ctx, batch) != 0)
+            break;
+    }
+
+    trim_at_stop_first_occurrence(out, gp.stops);
+    normalize_one_sentence(out);
+
+    {
+        const std::string key = u8"LR(0)";
+        size_t p = out.find(key);
+        if (p != std::string::npos && p > 0)
+        {
+            out = out.substr(p);
+            normalize_one_sentence(out);
+        }
+    }
+
+    answer.swap(out);
+
+    llama_batch_free(batch);
+    llama_sampler_free(smpl);
+    llama_free(ctx);
+    return 0;
+}
+
+// ---------- minimal JSON helpers for --server-stdio ----------
+static bool json_find_value(const std::string &s, const std::string &key, size_t &pos)
+{
+    const std::string pat = "\"" + key + "\"";
+    for (size_t p = s.find(pat); p != std::string::npos; p = s.find(pat, p + 1))
+    {
+        size_t q = p + pat.size();
+        while (q < s.size() && (s[q] == ' ' || s[q] == '\t'))
+            ++q;
+        if (q < s.size() && s[q] == ':')
+        {
+            ++q;
+            while (q < s.size() && (s[q] == ' ' || s[q] == '\t'))
+                ++q;
+            pos = q;
+            return true;
+        }
+    }
+    return false;
+}
+
+static void append_utf8(std::string &out, unsigned cp)
+{
+    if (cp < 0x80)
+    {
+        out.push_back((char)cp);
+    }
+    else if (cp < 0x800)
+    {
+        out.push_back((char)(0xC0 | (cp >> 6)));
+        out.push_back((char)(0x80 | (cp & 0x3F)));
+    }
+    else if (cp < 0x10000)
+    {
+        out.push_back((char)(0xE0 | (cp >> 12)));
+        out.push_back((char)(0x80 | ((cp >> 6) & 0x3F)));
+        out.push_back((char)(0x80 | (cp & 0x3F)));
+    }
+    else
+    {
+        out.push_back((char)(0xF0 | (cp >> 18)));
+        out.push_back((char)(0x80 | ((cp >> 12) & 0x3F)));
+        out.push_back((char)(0x80 | ((cp >> 6) & 0x3F)));
+        out.push_back((char)(0x80 | (cp & 0x3F)));
+    }
+}
+
+static bool parse_hex4(const std::string &s, size_t i, unsigned &cp)
+{
+    if (i + 4 > s.size())
+        return false;
+    cp = 0;
+    for (size_t k = i; k < i + 4; ++k)
+    {
+        char c = s[k];
+        cp <<= 4;
+        if (c >= '0' && c <= '9')
+            cp |= (unsigned)(c - '0');
+        else if (c >= 'a' && c <= 'f')
+            cp |= (unsigned)(c - 'a' + 10);
+        else if (c >= 'A' && c <= 'F')
+            cp |= (unsigned)(c - 'A' + 10);
+        else
+            return false;
+    }
+    return true;
+}
+
+static bool json_get_string(const std::string &s, const std::string &key, std::string &out)
+{
+    size_t i = 0;
+    if (!json_find_value(s, key, i) || i >= s.size() || s[i] != '"')
+        return false;
+
+    out.clear();
+    for (++i; i < s.size(); ++i)
+    {
+        char c = s[i];
+        if (c == '"')
+            return true;
+        if (c != '\\')
+        {
+            out.push_back(c);
+            continue;
+        }
+        if (++i >= s.size())
+            return false;
+        switch (s[i])
+        {
+        case '"':
+            out.push_back('"');
+            break;
+        case '\\':
+            out.push_back('\\');
+            break;
+        case '/':
+            out.push_back('/');
+            break;
+        case 'b':
+            out.push_back('\b');
+            break;
+        case 'f':
+            out.push_back('\f');
+            break;
+        case 'n':
+            out.push_back('\n');
+            break;
+        case 'r':
+            out.push_back('\r');
+            break;
+        case 't':
+            out.push_back('\t');
+            break;
+        case 'u':
+        {
+            unsigned cp = 0;
+            if (!parse_hex4(s, i + 1, cp))
+                return false;
+            i += 4;
+            // UTF-16 代理对
+            unsigned lo = 0;
+            if (cp >= 0xD800 && cp <= 0xDBFF && i + 2 < s.size() && s[i + 1] == '\\' && s[i + 2] == 'u' &&
+                parse_hex4(s, i + 3, lo) && lo >= 0xDC00 && lo <= 0xDFFF)
+            {
+                cp = 0x10000 + ((cp - 0xD800) << 10) + (lo - 0xDC00);
+                i += 6;
+            }
+            append_utf8(out, cp);
+            break;
+        }
+        default:
+            return false;
+        }
+    }
+    return false;
+}
+
+static bool json_get_int(const std::string &s, const std::string &key, long long &out)
+{
+    size_t i = 0;
+    if (!json_find_value(s, key, i))
+        return false;
+    const char *b = s.c_str() + i;
+    char *e = nullptr;
+    long long v = std::strtoll(b, &e, 10);
+    if (e == b)
+        return false;
+    out = v;
+    return true;
+}
+
+static std::string json_escape(const std::string &s)
+{
+    std::string out;
+    out.reserve(s.size() + 16);
+    for (unsigned char c : s)
+    {
+        switch (c)
+        {
+        case '"':
+            out += "\\\"";
+            break;
+        case '\\':
+            out += "\\\\";
+            break;
+        case '\n':
+            out += "\\n";
+            break;
+        case '\r':
+            out += "\\r";
+            break;
+        case '\t':
+            out += "\\t";
+            break;
+        default:
+            if (c < 0x20)
+            {
+                char buf[8];
+                std::snprintf(buf, sizeof(buf), "\\u%04x", c);
+                out += buf;
+            }
+            else
+            {
+                out.push_back((char)c);
+            }
+        }
+    }
+    return out;
+}
+
+// ---------- --server-stdio: 模型只加载一次，逐行处理请求 ----------
+// 请求（每行一个）：{"prompt": "...", "n": 256}   n 可省略
+// 响应（每行一个）：{"text": "...", "done": true} 或 {"error": "...", "done": true}
+static int run_server_stdio(llama_model *model, const GenParams &gp, const std::string &evidence)
+{
+    std::string line;
+    while (std::getline(std::cin, line))
+    {
+        if (!line.empty() && line.back() == '\r')
+            line.pop_back();
+        if (line.empty())
+            continue;
+
+        std::string question;
+        if (!json_get_string(line, "prompt", question))
+        {
+            std::cout << "{\"error\":\"missing or invalid prompt\",\"done\":true}" << std::endl;
+            continue;
+        }
+
+        GenParams req = gp;
+        long long n = 0;
+        if (json_get_int(line, "n", n) && n > 0)
+            req.n_predict = (int)n;
+
+        std::string out;
+        int rc = generate_answer(model, req, question, evidence, out);
+        if (rc != 0)
+            std::cout << "{\"error\":\"generation failed, code " << rc << "\",\"done\":true}" << std::endl;
+        else
+            std::cout << "{\"text\":\"" << json_escape(out) << "\",\"done\":true}" << std::endl;
+    }
+    return 0;
+}
+
 int main(int argc, char **argv)
 {
     win32_enable_utf8_console();
@@ -253,6 +672,7 @@ int main(int argc, char **argv)
     float top_p = 0.9f;
     int seed = 42;
     bool debug_prompt = false;
+    bool server_stdio = false; // --server-stdio
 
     std::vector<std::string> stops = {
         "\nHuman:", "\nUser:", "\nassistant:", "\nAssistant:",
@@ -411,6 +831,10 @@ int main(int argc, char **argv)
         {
             debug_prompt = true;
         }
+        else if (a == "--server-stdio")
+        {
+            server_stdio = true;
+        }
         else if (a == "--help" || a == "-h")
         {
             std::cout
@@ -419,7 +843,8 @@ int main(int argc, char **argv)
                 << "          [--context-file <context.txt>]\n"
                 << "          [--db <documents.db> --table <table> --col <content_col> --ids 1,2,3]\n"
                 << "          [--n <tokens>] [--ctx <n>] [--batch <n>]\n"
-                << "          [--temp <f>] [--topk <k>] [--topp <p>] [--seed <n>] [--debug-prompt]\n\n"
+                << "          [--temp <f>] [--topk <k>] [--topp <p>] [--seed <n>] [--debug-prompt]\n"
+                << "          [--server-stdio]   # 常驻模式：stdin 每行一个 JSON 请求，stdout 每行一个 JSON 响应\n\n"
                 << "Examples:\n"
                 << "  llm_cli --model models\\qwen2.5-3b-instruct-q5_k_m.gguf --prompt \"解释LR(0)项目集\" --context-file context.txt\n"
                 << "  llm_cli --model models\\qwen2.5-3b-instruct-q5_k_m.gguf --prompt \"...\" --db documents.db --table documents --col content --ids 1,2,3\n";
@@ -465,187 +890,24 @@ int main(int argc, char **argv)
         return 3;
     }
 
-    // 3) context
-    llama_context_params cparams = llama_context_default_params();
-    cparams.n_ctx = n_ctx;
-    cparams.n_batch = n_batch;
-
-    llama_context *ctx = llama_new_context_with_model(model, cparams);
-    if (!ctx)
-    {
-        std::cerr << "Failed to create context\n";
-        llama_free_model(model);
-        llama_backend_free();
-        return 3;
-    }
-
-    // 4) system + user prompt (注入证据)
-    std::string system = u8"你是计算机专业课程助教，只能用中文回答。"
-                         u8"输出必须满足："
-                         u8"（1）只输出一句话；（2）必须是定义式；（3）不得出现“好的/请/根据/无法/示例”等套话；"
-                         u8"（4）不得输出换行；（5）不得输出多余标点。";
+    GenParams gp{n_predict, n_ctx, n_batch, temp, top_k, top_p, seed, debug_prompt, stops};
 
-    std::string user;
-    if (!evidence.empty())
+    int rc = 0;
+    if (server_stdio)
     {
-        user = u8"以下是检索到的资料证据（回答必须基于这些证据，且不得编造）：\n";
-        user += evidence;
-        user += u8"\n请按以下格式回答：\n【定义】LR(0)项目集：<一句话定义>。\n问题：";
-        user += user_question;
+        rc = run_server_stdio(model, gp, evidence);
     }
     else
     {
-        user = u8"请按以下格式回答：\n【定义】LR(0)项目集：<一句话定义>。\n问题：";
-        user += user_question;
-    }
-
-    std::vector<llama_chat_message> msgs;
-    msgs.push_back({"system", system.c_str()});
-    msgs.push_back({"user", user.c_str()});
-
-    std::string prompt;
-    prompt.resize(64 * 1024);
-
-    int pn = llama_chat_apply_template(
-        nullptr, // use template stored in GGUF metadata
-        msgs.data(),
-        (int)msgs.size(),
-        true, // add assistant prefix
-        prompt.data(),
-        (int)prompt.size());
-    if (pn < 0)
-    {
-        std::cerr << "llama_chat_apply_template failed\n";
-        llama_free(ctx);
-        llama_free_model(model);
-        llama_backend_free();
-        return 6;
-    }
-    prompt.resize(pn);
-
-    if (debug_prompt)
-    {
-        std::cerr << "\n[DEBUG PROMPT]\n"
-                  << prompt.substr(0, 1200) << "\n[/DEBUG PROMPT]\n";
+        std::string out;
+        rc = generate_answer(model, gp, user_question, evidence, out);
+        if (rc == 0)
+            std::cout << "\n--- model output ---\n"
+                      << out << "\n--- end ---\n";
     }
 
-    // 5) tokenize
-    const llama_vocab *vocab = llama_model_get_vocab(model);
-
-    std::vector<llama_token> tokens;
-    tokens.resize(prompt.size() + 64);
-
-    int n_prompt = llama_tokenize(
-        vocab,
-        prompt.c_str(),
-        (int)prompt.size(),
-        tokens.data(),
-        (int)tokens.size(),
-        true, // add_special
-        false // parse_special
-    );
-    if (n_prompt < 0)
-    {
-        std::cerr << "Tokenize failed\n";
-        llama_free(ctx);
-        llama_free_model(model);
-        llama_backend_free();
-        return 4;
-    }
-    tokens.resize(n_prompt);
-
-    // 6) eval prompt
-    llama_batch batch = llama_batch_init(n_batch, 0, 1);
-    batch.n_tokens = 0;
-
-    for (int i = 0; i < (int)tokens.size(); ++i)
-    {
-        batch.token[batch.n_tokens] = tokens[i];
-        batch.pos[batch.n_tokens] = i;
-        batch.seq_id[batch.n_tokens][0] = 0;
-        batch.n_seq_id[batch.n_tokens] = 1;
-        batch.logits[batch.n_tokens] = false;
-        batch.n_tokens++;
-    }
-    batch.logits[batch.n_tokens - 1] = true;
-
-    if (llama_decode(ctx, batch) != 0)
-    {
-        std::cerr << "llama_decode(prompt) failed\n";
-        llama_batch_free(batch);
-        llama_free(ctx);
-        llama_free_model(model);
-        llama_backend_free();
-        return 5;
-    }
-
-    // 7) sampler chain
-    llama_sampler *smpl = llama_sampler_chain_init(llama_sampler_chain_default_params());
-    llama_sampler_chain_add(smpl, llama_sampler_init_top_k(top_k));
-    llama_sampler_chain_add(smpl, llama_sampler_init_top_p(top_p, 1));
-    llama_sampler_chain_add(smpl, llama_sampler_init_temp(temp));
-    llama_sampler_chain_add(smpl, llama_sampler_init_dist((uint32_t)seed));
-
-    // 8) generation
-    std::cout << "\n--- model output ---\n";
-
-    int n_cur = (int)tokens.size();
-    std::string out;
-    out.reserve((size_t)n_predict * 6);
-
-    for (int i = 0; i < n_predict; ++i)
-    {
-        llama_token id = llama_sampler_sample(smpl, ctx, -1);
-        llama_sampler_accept(smpl, id);
-
-        if (id == llama_token_eos(vocab))
-            break;
-
-        char buf[4096];
-        int nb = llama_token_to_piece(vocab, id, buf, (int)sizeof(buf), 0, true);
-        if (nb <= 0)
-            break;
-
-        out.append(buf, buf + nb);
-
-        if (ends_with_any(out, stops))
-        {
-            trim_at_stop_first_occurrence(out, stops);
-            break;
-        }
-
-        batch.n_tokens = 0;
-        batch.token[batch.n_tokens] = id;
-        batch.pos[batch.n_tokens] = n_cur++;
-        batch.seq_id[batch.n_tokens][0] = 0;
-        batch.n_seq_id[batch.n_tokens] = 1;
-        batch.logits[batch.n_tokens] = true;
-        batch.n_tokens++;
-
-        if (llama_decode(ctx, batch) != 0)
-            break;
-    }
-
-    trim_at_stop_first_occurrence(out, stops);
-    normalize_one_sentence(out);
-
-    {
-        const std::string key = u8"LR(0)";
-        size_t p = out.find(key);
-        if (p != std::string::npos && p > 0)
-        {
-            out = out.substr(p);
-            normalize_one_sentence(out);
-        }
-    }
-
-    std::cout << out << "\n--- end ---\n";
-
     // 9) cleanup
-    llama_batch_free(batch);
-    llama_sampler_free(smpl);
-    llama_free(ctx);
     llama_free_model(model);
     llama_backend_free();
-    return 0;
+    return rc;
 }
@@ -1,80 +1,208 @@
+import json
+import os
 import pickle
 import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Tuple
+from functools import lru_cache
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import jieba  # pip install jieba
 import numpy as np
-from rank_bm25 import BM25Okapi
+from scipy import sparse
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# 少于这个行数时串行分词，进程池的启动开销不划算
+PARALLEL_MIN_ROWS = 2000
+
+
+# 英文/数字按单词，中文按连续片段（再交给 jieba 切词）
+_TOK = re.compile(r"[a-z0-9]+|[\u4e00-\u9fff]+")
+
+
+def _cut_cjk(run: str) -> List[str]:
+    # jieba 在第一次切词时才加载词典（约 0.6s），纯英文语料/查询不付这个开销
+    return jieba.lcut_for_search(run)
 
 
 def tokenize_zh_en(text: str) -> List[str]:
     """
-    M1 简化分词：
+    分词：
     - 英文按单词
-    - 中文按单字（足够做 BM25 baseline）
+    - 中文用 jieba 搜索引擎模式切词
+    建库和查询都走这一个函数，大小写折叠方式一致（如 K U+212A、İ 这类非 ASCII 大写）
     """
-    text = text.lower()
-    # 提取英文词
-    en = re.findall(r"[a-z0-9]+", text)
-    # 提取中文字符
-    zh = re.findall(r"[\u4e00-\u9fff]", text)
-    return en + zh
+    out: List[str] = []
+    for t in _TOK.findall(text.lower()):
+        if t.isascii():
+            out.append(t)
+        else:
+            out.extend(_cut_cjk(t))
+    return out
+
+
+@lru_cache(maxsize=1024)
+def _query_tokens(query: str) -> Tuple[str, ...]:
+    # 同一个 query 反复检索（多分区/多轮）时不再重复跑分词正则
+    return tuple(tokenize_zh_en(query))
 
 
 @dataclass
 class BM25Index:
-    bm25: BM25Okapi
-    doc_keys: List[int]     # 对应 SQLite 的 documents.id
+    doc_keys: Sequence[int]  # 对应 SQLite 的 documents.id（load 后为 mmap 数组）
     doc_meta: List[Tuple]   # (doc_id, doc_path, chunk_id, line_start, line_end)
-    tokenized: List[List[str]]
+    vocab: Dict[str, int]   # token -> term id
+    idf: np.ndarray         # (V,) float32
+    avgdl: float
+    doc_lens: np.ndarray    # (N,) float32
+    postings: sparse.csr_matrix  # (V, N)，每行是一个 term 的 posting list，值为该 term 对该文档的 BM25 分量
 
     def save(self, path: str) -> None:
-        with open(path, "wb") as f:
-            pickle.dump(self, f)
+        """
+        path 为目录：
+        header.json（vocab / N / avgdl）+ 各数组一个 .npy + doc_meta.pkl
+        """
+        os.makedirs(path, exist_ok=True)
+        header = {"n_docs": len(self.doc_keys), "avgdl": self.avgdl, "vocab": self.vocab}
+        with open(os.path.join(path, "header.json"), "w", encoding="utf-8") as f:
+            json.dump(header, f, ensure_ascii=False)
+        np.save(os.path.join(path, "idf.npy"), self.idf)
+        np.save(os.path.join(path, "doc_lens.npy"), self.doc_lens)
+        np.save(os.path.join(path, "doc_keys.npy"), np.asarray(self.doc_keys, dtype=np.int64))
+        np.save(os.path.join(path, "postings.indptr.npy"), self.postings.indptr.astype(np.int32))
+        np.save(os.path.join(path, "postings.indices.npy"), self.postings.indices.astype(np.int32))
+        np.save(os.path.join(path, "postings.data.npy"), self.postings.data)
+        with open(os.path.join(path, "doc_meta.pkl"), "wb") as f:
+            pickle.dump(self.doc_meta, f)
 
     @staticmethod
     def load(path: str) -> "BM25Index":
-        with open(path, "rb") as f:
-            return pickle.load(f)
+        """
+        数组全部 mmap 打开：启动时不读入内存，查询时只有命中的 posting 页被换入
+        """
+        def arr(name: str) -> np.ndarray:
+            return np.load(os.path.join(path, name), mmap_mode="r")
+
+        with open(os.path.join(path, "header.json"), "r", encoding="utf-8") as f:
+            header = json.load(f)
+        with open(os.path.join(path, "doc_meta.pkl"), "rb") as f:
+            doc_meta = pickle.load(f)
 
+        vocab = header["vocab"]
+        postings = sparse.csr_matrix(
+            (arr("postings.data.npy"), arr("postings.indices.npy"), arr("postings.indptr.npy")),
+            shape=(len(vocab), header["n_docs"]),
+            copy=False,
+        )
+        return BM25Index(
+            doc_keys=arr("doc_keys.npy"),
+            doc_meta=doc_meta,
+            vocab=vocab,
+            idf=arr("idf.npy"),
+            avgdl=float(header["avgdl"]),
+            doc_lens=arr("doc_lens.npy"),
+            postings=postings,
+        )
 
-def build_bm25_from_sql_rows(rows: List[Tuple]) -> BM25Index:
+
+def tokenize_corpus(texts: List[str], workers: Optional[int] = None) -> List[List[str]]:
+    """
+    按行分词，行之间互不相关，大语料时分发到进程池（workers=None 为 CPU 核数）。
+    """
+    if workers == 1 or len(texts) < PARALLEL_MIN_ROWS:
+        return [tokenize_zh_en(t) for t in texts]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(tokenize_zh_en, texts, chunksize=256))
+
+
+def build_bm25_from_sql_rows(rows: List[Tuple], workers: Optional[int] = None) -> BM25Index:
     """
     rows: (id, doc_id, doc_path, doc_type, chunk_id, text, page_start, page_end, line_start, line_end)
     """
+    corpus_tokens = tokenize_corpus([r[5] or "" for r in rows], workers=workers)
+
     doc_keys = []
     doc_meta = []
-    corpus_tokens = []
-    for r in rows:
+    vocab: Dict[str, int] = {}
+    doc_lens = []
+    # COO 三元组：(term id, doc idx, tf)
+    term_ids: List[int] = []
+    doc_idx: List[int] = []
+    tfs: List[int] = []
+    for j, (r, toks) in enumerate(zip(rows, corpus_tokens)):
         doc_row_id = int(r[0])
         doc_id = r[1]
         doc_path = r[2]
         chunk_id = int(r[4])
-        text = r[5] or ""
         line_start = r[8]
         line_end = r[9]
 
-        toks = tokenize_zh_en(text)
         doc_keys.append(doc_row_id)
         doc_meta.append((doc_id, doc_path, chunk_id, line_start, line_end))
-        corpus_tokens.append(toks)
+        doc_lens.append(len(toks))
+        for tok, tf in Counter(toks).items():
+            term_ids.append(vocab.setdefault(tok, len(vocab)))
+            doc_idx.append(j)
+            tfs.append(tf)
+
+    n_docs = len(doc_keys)
+    postings = sparse.csr_matrix(
+        (np.asarray(tfs, dtype=np.float32), (term_ids, doc_idx)),
+        shape=(len(vocab), n_docs),
+    )
+    # 每个 term 的文档频率 = 该行非零个数
+    df = np.diff(postings.indptr)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+    lens = np.asarray(doc_lens, dtype=np.float32)
+    avgdl = float(lens.mean()) if n_docs else 0.0
+
+    # 建库时把 idf、tf 饱和与长度归一化全部算进 posting 值（PISA 式预计算），
+    # 查询时只剩按 term 取行、累加
+    tf = postings.data
+    norm = BM25_K1 * (1.0 - BM25_B + BM25_B * lens / max(avgdl, 1e-9))
+    term_of_nnz = np.repeat(np.arange(len(vocab)), df)
+    postings.data = (
+        idf[term_of_nnz] * tf * (BM25_K1 + 1.0) / (tf + norm[postings.indices])
+    ).astype(np.float32)
 
-    bm25 = BM25Okapi(corpus_tokens)
-    return BM25Index(bm25=bm25, doc_keys=doc_keys, doc_meta=doc_meta, tokenized=corpus_tokens)
+    return BM25Index(
+        doc_keys=doc_keys,
+        doc_meta=doc_meta,
+        vocab=vocab,
+        idf=idf,
+        avgdl=avgdl,
+        doc_lens=lens,
+        postings=postings,
+    )
 
 
 def search(index: BM25Index, query: str, top_k: int = 5) -> List[Tuple[int, float]]:
     """
     return: [(sqlite_row_id, score)]
     """
-    qtok = tokenize_zh_en(query)
-    scores = index.bm25.get_scores(qtok)
-    scores = np.asarray(scores, dtype=np.float32)
-    if scores.size == 0:
+    n_docs = len(index.doc_keys)
+    tids = [index.vocab[t] for t in _query_tokens(query) if t in index.vocab]
+    if n_docs == 0 or not tids:
         return []
 
-    top_idx = np.argsort(-scores)[:top_k]
+    scores = np.zeros(n_docs, dtype=np.float32)
+    post = index.postings
+    for tid in tids:
+        lo, hi = post.indptr[tid], post.indptr[tid + 1]
+        scores[post.indices[lo:hi]] += post.data[lo:hi]
+
+    # 只在命中过的文档里选前 K：argpartition O(n) 划分，再只对 K 个排序
+    cand = np.flatnonzero(scores)
+    k = min(top_k, cand.size)
+    if k <= 0:
+        return []
+    cand_scores = scores[cand]
+    part = np.argpartition(-cand_scores, k - 1)[:k]
+    top_idx = cand[part[np.argsort(-cand_scores[part])]]
     out = []
     for i in top_idx:
-        out.append((index.doc_keys[int(i)], float(scores[int(i)])))
+        out.append((int(index.doc_keys[int(i)]), float(scores[int(i)])))
     return out
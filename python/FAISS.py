@@ -1,36 +1,73 @@
 import faiss                   # 导入 faiss 库
 import numpy as np             # 用于数值计算
 
+PQ_M = 16                      # PQ 子空间个数（dimension 需能被整除）
+PQ_NBITS = 8                   # 每个子空间的码本位数（256 个中心）
+
+
+def ivf_nlist(n_vectors):
+    # 聚类中心个数：约 2*sqrt(N)，至少 20
+    return max(int(2 * np.sqrt(n_vectors)), 20)
+
+
+def l2_normalize(vectors):
+    # 拷贝成 float32 (N, D) 后按行归一化，不改调用方的数组
+    x = np.atleast_2d(np.array(vectors, dtype=np.float32))
+    faiss.normalize_L2(x)
+    return x
+
 # 创建或加载 FAISS 索引
-def create_faiss_index(dimension):
-    # 使用 L2 距离度量的 IndexFlatL2
-    index = faiss.IndexFlatL2(dimension)  # 使用L2距离的索引
+def create_faiss_index(dimension, train_data=None):
+    """
+    向量统一做 L2 归一化，用内积（即余弦相似度）检索：
+    - 样本足够时：IndexIVFPQ（倒排 + PQ 压缩），查询只扫 nprobe 个桶
+    - 否则：IndexScalarQuantizer int8（扫描带宽约为 float32 的 1/4）
+    - 没有训练样本：IndexFlatIP
+    """
+    if train_data is None:
+        return faiss.IndexFlatIP(dimension)
+
+    data = l2_normalize(train_data)
+    n = len(data)
+    nlist = ivf_nlist(n)
+    # k-means 每个中心建议 >= 39 个样本：IVF 有 nlist 个中心，PQ 每个子空间有 2**nbits 个中心
+    if n >= 39 * max(nlist, 2 ** PQ_NBITS) and dimension % PQ_M == 0:
+        quantizer = faiss.IndexFlatIP(dimension)
+        index = faiss.IndexIVFPQ(
+            quantizer, dimension, nlist, PQ_M, PQ_NBITS, faiss.METRIC_INNER_PRODUCT
+        )
+        index.train(data)
+        index.nprobe = min(nlist // 4, 10)
+        return index
+
+    index = faiss.IndexScalarQuantizer(
+        dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+    )
+    index.train(data)  # 统计每一维的取值范围
     return index
 
 # 示例：加载数据并添加到 FAISS 索引
 def add_to_faiss(index, data):
-    # 将数据添加到索引中
-    data = np.array(data).astype(np.float32)  # 确保数据是float32类型
-    index.add(data)  # 添加数据
+    # 归一化后再加入索引（同时保证是 float32）
+    index.add(l2_normalize(data))
     return index
 
 # 获取相关文档的 FAISS 检索
-def faiss_search(index, query_vector, k=5):
-    # 从FAISS索引中查找最相似的k个文档
-    distances, indices = index.search(np.array([query_vector]).astype(np.float32), k)
+def faiss_search(index, query_vectors, k=5):
+    # query_vectors: (DIM,) 单条 或 (B, DIM) 批量；返回 (B, k) 的 indices / 相似度
+    q = l2_normalize(query_vectors)
+    distances, indices = index.search(q, k)
     return indices, distances
 
 # FAISS 索引的创建示例
 if __name__ == "__main__":
     # 假设文档向量的维度是128
-    index = create_faiss_index(128)
-
-    # 示例文档向量
     docs = np.random.random((10, 128))  # 10个文档，每个128维
+    index = create_faiss_index(128, docs)
     index = add_to_faiss(index, docs)
 
     # 查询向量
     query = np.random.random(128)
     indices, distances = faiss_search(index, query)
     print(f"Top 5 closest document indices: {indices}")
-    print(f"Distances: {distances}")
+    print(f"Cosine similarities: {distances}")
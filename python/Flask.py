@@ -1,45 +1,62 @@
+import hashlib
+import os
+import threading
+
 from flask import Flask, request, jsonify
 import numpy as np
 
 try:
     import faiss  # pip install faiss-cpu
+    from FAISS import create_faiss_index, l2_normalize
 except Exception:
     faiss = None
 
+try:
+    from cachetools import TTLCache  # pip install cachetools
+except Exception:
+    TTLCache = None
+
 app = Flask(__name__)
 
 DIM = 128
 TOPK_DEFAULT = 5
 TOPK_MAX = 20
+BATCH_MAX = 64
 
-
-def create_faiss_index(dimension: int):
-    if faiss is None:
-        raise RuntimeError("faiss 未安装。请先 pip install faiss-cpu")
-    return faiss.IndexFlatL2(dimension)
+# /search 结果缓存（每个 worker 进程一份）；没装 cachetools 时不缓存。
+# 索引在进程内重建时需要 _search_cache.clear()
+SEARCH_CACHE_SIZE = 1024
+SEARCH_CACHE_TTL = 300  # 秒
+_search_cache = TTLCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL) if TTLCache is not None else None
+_search_cache_lock = threading.Lock()  # TTLCache 本身不是线程安全的（gthread worker）
 
 
 def add_to_faiss(index, docs: np.ndarray):
     docs = np.asarray(docs)
-    if docs.dtype != np.float32:
-        docs = docs.astype(np.float32)
     if docs.ndim != 2 or docs.shape[1] != DIM:
         raise ValueError(f"docs must be shape (N, {DIM}), got {docs.shape}")
-    index.add(docs)
+    index.add(l2_normalize(docs))
     return index
 
 
-def faiss_search(index, query: np.ndarray, k: int):
-    # query: shape (1, DIM), float32
-    distances, indices = index.search(query, k)
-    return indices[0], distances[0]
+def faiss_search(index, queries: np.ndarray, k: int):
+    # queries: shape (B, DIM)；返回 (B, k)，distances 为余弦相似度（越大越相似）
+    distances, indices = index.search(l2_normalize(queries), k)
+    return indices, distances
 
 
 # ---- init demo index ----
+# 放在模块级：gunicorn preload_app 时只在 master 里建一次，fork 后共享
 index = None
 if faiss is not None:
-    index = create_faiss_index(DIM)
+    # 批量查询时 FAISS 用 OpenMP 多线程；gunicorn.conf.py 把 FAISS_OMP_THREADS 设为 1
+    try:
+        omp_threads = int(os.environ.get("FAISS_OMP_THREADS", os.cpu_count() or 1))
+    except ValueError:
+        omp_threads = 1
+    faiss.omp_set_num_threads(max(omp_threads, 1))
     docs = np.random.random((10, DIM)).astype(np.float32)
+    index = create_faiss_index(DIM, docs)
     add_to_faiss(index, docs)
 
 
@@ -47,9 +64,10 @@ if faiss is not None:
 def home():
     return jsonify(
         ok=True,
-        message='Server is running. Use POST /search with JSON {"query": [128 floats]}',
+        message='Server is running. Use POST /search with JSON {"query": [128 floats]} or {"queries": [[128 floats], ...]}',
         dim=DIM,
         topk_default=TOPK_DEFAULT,
+        batch_max=BATCH_MAX,
         faiss_installed=(faiss is not None),
         index_ready=(index is not None),
     )
@@ -68,6 +86,7 @@ def docs():
             "GET /health": "health check",
             "GET /docs": "this help",
             "POST /search": 'JSON {"query":[128 floats], "topk": optional int<=20}',
+            "POST /search (batch)": 'JSON {"queries":[[128 floats], ...] (<=64), "topk": optional int<=20}',
         },
         curl_example=[
             'python -c "import json; print(json.dumps({\'query\':[0.0]*128}))" > payload.json',
@@ -81,15 +100,35 @@ def search():
     if index is None:
         return jsonify(error="FAISS index not initialized. Is faiss installed?"), 500
 
+    # 以请求体摘要为 key（已包含 query/queries 与 topk），命中直接返回
+    cache_key = None
+    if _search_cache is not None:
+        cache_key = hashlib.sha1(request.get_data()).digest()
+        with _search_cache_lock:
+            cached = _search_cache.get(cache_key)
+        if cached is not None:
+            return jsonify(**cached)
+
     data = request.get_json(silent=True)
     if not isinstance(data, dict):
         return jsonify(error="Invalid JSON body. Expect a JSON object."), 400
 
-    query = data.get("query", None)
-    if not isinstance(query, list):
-        return jsonify(error=f"Field 'query' must be a list of length {DIM}."), 400
-    if len(query) != DIM:
-        return jsonify(error=f"Query vector must be of dimension {DIM}, got {len(query)}"), 400
+    # 单条 {"query": [...]} 或批量 {"queries": [[...], ...]}；批量时一次 index.search 处理全部
+    batched = "queries" in data
+    if batched:
+        queries = data["queries"]
+        if not isinstance(queries, list) or not queries:
+            return jsonify(error="Field 'queries' must be a non-empty list of vectors."), 400
+        if len(queries) > BATCH_MAX:
+            return jsonify(error=f"Too many queries. Max is {BATCH_MAX}."), 400
+    else:
+        queries = [data.get("query", None)]
+
+    for query in queries:
+        if not isinstance(query, list):
+            return jsonify(error=f"Field 'query' must be a list of length {DIM}."), 400
+        if len(query) != DIM:
+            return jsonify(error=f"Query vector must be of dimension {DIM}, got {len(query)}"), 400
 
     # 可选 topk
     topk = data.get("topk", TOPK_DEFAULT)
@@ -99,12 +138,20 @@ def search():
         return jsonify(error=f"topk too large. Max is {TOPK_MAX}."), 400
 
     try:
-        q = np.array(query, dtype=np.float32).reshape(1, -1)
+        q = np.asarray(queries, dtype=np.float32)
     except Exception:
         return jsonify(error="Query contains non-numeric values."), 400
 
     idxs, dists = faiss_search(index, q, topk)
-    return jsonify(indices=idxs.tolist(), distances=dists.tolist())
+    if batched:
+        result = dict(indices=idxs.tolist(), distances=dists.tolist())
+    else:
+        result = dict(indices=idxs[0].tolist(), distances=dists[0].tolist())
+
+    if cache_key is not None:
+        with _search_cache_lock:
+            _search_cache[cache_key] = result
+    return jsonify(**result)
 
 
 # 如果有人用浏览器 GET /search，给出明确提示
@@ -114,6 +161,7 @@ def search_get_not_allowed():
 
 
 if __name__ == "__main__":
+    # 仅供本机调试（单线程 dev server）；部署用 gunicorn -c gunicorn.conf.py Flask:app
     # 本机调试：127.0.0.1
     # 局域网访问：改成 0.0.0.0，然后用你电脑的 IPv4 访问（不要用 0.0.0.0）
     app.run(host="127.0.0.1", port=5000, debug=True, use_reloader=False)
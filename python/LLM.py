@@ -0,0 +1,105 @@
+import atexit
+import json
+import subprocess
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+
+class LLMServer:
+    """
+    常驻的 llm_cli --server-stdio 子进程：模型只在启动时加载一次，
+    之后每个请求写一行 JSON，读回一行 {"text": ..., "done": true}。
+    """
+
+    def __init__(self, llm_exe: str, model_path: str, extra_args: Sequence[str] = ()):
+        self.cmd = [str(llm_exe), "--model", str(model_path), *extra_args, "--server-stdio"]
+        self._proc: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self) -> subprocess.Popen:
+        if self._proc is None or self._proc.poll() is not None:
+            self._proc = subprocess.Popen(
+                self.cmd,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                # llama.cpp 的日志走 stderr；不读的话管道写满会卡住子进程
+                stderr=subprocess.DEVNULL,
+                text=True,
+                encoding="utf-8",
+                errors="ignore",
+                bufsize=1,
+            )
+        return self._proc
+
+    def _discard(self) -> None:
+        # 读到 EOF 后子进程可能还没被回收（poll() 仍是 None），先收尸再清空，
+        # 下一次 generate() 才会重新拉起子进程
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc.wait()
+            self._proc = None
+
+    def generate(self, prompt: str, n: Optional[int] = None) -> str:
+        req = {"prompt": prompt}
+        if n is not None:
+            req["n"] = n
+
+        # 一个进程同一时间只处理一个请求
+        with self._lock:
+            proc = self._ensure_started()
+            try:
+                proc.stdin.write(json.dumps(req, ensure_ascii=False) + "\n")
+                proc.stdin.flush()
+                while True:
+                    line = proc.stdout.readline()
+                    if not line:
+                        break
+                    try:
+                        msg = json.loads(line)
+                    except ValueError:
+                        continue  # 非协议输出，忽略
+                    if not isinstance(msg, dict) or not msg.get("done"):
+                        continue
+                    if "error" in msg:
+                        raise RuntimeError(f"llm_cli: {msg['error']}")
+                    return msg.get("text", "")
+            except OSError:
+                # 子进程已退出时写 stdin 会 BrokenPipeError
+                self._discard()
+                raise
+            self._discard()
+            raise RuntimeError(
+                "llm_cli 常驻进程意外退出（是否为不支持 --server-stdio 的旧版本？）"
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._proc is not None and self._proc.poll() is None:
+                self._proc.stdin.close()  # EOF -> 服务循环退出
+                try:
+                    self._proc.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    self._proc.kill()
+            self._proc = None
+
+
+_SERVERS: Dict[Tuple, LLMServer] = {}
+_SERVERS_LOCK = threading.Lock()
+
+
+def get_server(llm_exe: str, model_path: str, extra_args: Sequence[str] = ()) -> LLMServer:
+    """
+    同一 (exe, model, 参数) 在进程内只起一个子进程
+    """
+    key = (str(llm_exe), str(model_path), tuple(extra_args))
+    with _SERVERS_LOCK:
+        srv = _SERVERS.get(key)
+        if srv is None:
+            srv = _SERVERS[key] = LLMServer(llm_exe, model_path, extra_args)
+        return srv
+
+
+@atexit.register
+def _close_all() -> None:
+    for srv in list(_SERVERS.values()):
+        srv.close()
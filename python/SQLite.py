@@ -1,9 +1,10 @@
+import bisect
 import os
 import re
 import sqlite3
 import time
 from dataclasses import dataclass
-from typing import List, Optional, Tuple
+from typing import Iterable, Iterator, List, Optional, Tuple
 
 import fitz  # PyMuPDF
 
@@ -34,6 +35,9 @@ def connect(db_path: str) -> sqlite3.Connection:
     conn = sqlite3.connect(db_path)
     conn.execute("PRAGMA journal_mode=WAL;")
     conn.execute("PRAGMA synchronous=NORMAL;")
+    conn.execute("PRAGMA temp_store=MEMORY;")
+    conn.execute("PRAGMA cache_size=-200000;")    # 约 200MB 页缓存
+    conn.execute("PRAGMA mmap_size=268435456;")   # 256MB mmap 读
     return conn
 
 
@@ -64,21 +68,28 @@ def init_schema(conn: sqlite3.Connection) -> None:
     conn.commit()
 
 
-def clear_doc(conn: sqlite3.Connection, doc_path: str) -> None:
-    conn.execute("DELETE FROM documents WHERE doc_path = ?;", (doc_path,))
-    conn.commit()
+def clear_doc(conn: sqlite3.Connection, doc_path: str, commit: bool = True) -> int:
+    # 返回删掉的旧 chunk 行数
+    cur = conn.execute("DELETE FROM documents WHERE doc_path = ?;", (doc_path,))
+    if commit:
+        conn.commit()
+    return cur.rowcount
 
 
-def insert_chunks(conn: sqlite3.Connection, chunks: List[Chunk]) -> None:
+def insert_chunks(conn: sqlite3.Connection, chunks: Iterable[Chunk], commit: bool = True) -> int:
+    """
+    chunks 可以是生成器（边切边写，不必先攒成 list）；返回插入的行数。
+    commit=False 时由调用方把多次写入合并进同一个事务（见 ingest.py）
+    """
     now = int(time.time())
-    conn.executemany(
+    cur = conn.executemany(
         """
         INSERT INTO documents
         (doc_id, doc_path, doc_type, chunk_id, text, start_char, end_char,
          page_start, page_end, line_start, line_end, created_at)
         VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?);
         """,
-        [
+        (
             (
                 c.doc_id,
                 c.doc_path,
@@ -94,9 +105,11 @@ def insert_chunks(conn: sqlite3.Connection, chunks: List[Chunk]) -> None:
                 now,
             )
             for c in chunks
-        ],
+        ),
     )
-    conn.commit()
+    if commit:
+        conn.commit()
+    return cur.rowcount
 
 
 def fetch_all_chunks(conn: sqlite3.Connection) -> List[Tuple]:
@@ -126,22 +139,31 @@ def read_txt_md(path: str) -> str:
         return f.read()
 
 
-def read_pdf(path: str) -> str:
+def iter_pdf_pages(path: str) -> Iterator[Tuple[int, str]]:
+    """
+    逐页产出 (页码(从 1 开始), 页文本)，不把整本 PDF 拼成一个大字符串
+    """
     doc = fitz.open(path)
-    parts = []
-    for i in range(doc.page_count):
-        page = doc.load_page(i)
-        txt = page.get_text("text")
-        if txt:
-            parts.append(f"\n[PAGE {i+1}]\n{txt}")
-    doc.close()
-    return "\n".join(parts)
+    try:
+        for i in range(doc.page_count):
+            page = doc.load_page(i)
+            txt = page.get_text("text")
+            if txt:
+                yield i + 1, txt
+    finally:
+        doc.close()
+
+
+# 只匹配真正需要改写的空白：连续空白或 tab（单个空格本来就是目标形式，不必替换）
+_WS_RE = re.compile(r"[ \t]{2,}|\t")
+_MULTI_NL_RE = re.compile(r"\n{3,}")
 
 
 def normalize_text(s: str) -> str:
-    s = s.replace("\r\n", "\n").replace("\r", "\n")
-    s = re.sub(r"[ \t]+", " ", s)
-    s = re.sub(r"\n{3,}", "\n\n", s)
+    if "\r" in s:
+        s = s.replace("\r\n", "\n").replace("\r", "\n")
+    s = _WS_RE.sub(" ", s)
+    s = _MULTI_NL_RE.sub("\n\n", s)
     return s.strip()
 
 
@@ -165,51 +187,72 @@ def chunk_text_by_chars(
     start = 0
     while start < n:
         end = min(n, start + chunk_size)
-        chunk = text[start:end].strip()
-        if chunk:
-            chunks.append((start, end, chunk))
+        # 先在原文上找去掉首尾空白后的边界（等价于 strip），
+        # 只对非空 chunk 切一次字符串，不再“切片 + strip”两次拷贝
+        st, ed = start, end
+        while st < ed and text[st].isspace():
+            st += 1
+        while ed > st and text[ed - 1].isspace():
+            ed -= 1
+        if st < ed:
+            chunks.append((start, end, text[st:ed]))
         if end == n:
             break
         start = end - chunk_overlap
     return chunks
 
 
-def build_chunks_for_file(path: str) -> List[Chunk]:
+def iter_chunks_for_file(path: str) -> Iterator[Chunk]:
+    """
+    pdf 按页处理（chunk 不跨页，page_start/page_end 为真实页码）；txt/md 视为一页。
+    start_char/end_char 与行号按“各页规范化文本以 \\n 相接”的全文计算。
+    """
     ext = os.path.splitext(path)[1].lower()
     doc_type = ext.lstrip(".") if ext else "unknown"
     doc_id = os.path.basename(path)
 
     if ext == ".pdf":
-        raw = read_pdf(path)
+        sections = ((page_no, normalize_text(txt)) for page_no, txt in iter_pdf_pages(path))
     elif ext in (".txt", ".md"):
-        raw = read_txt_md(path)
+        sections = iter([(None, normalize_text(read_txt_md(path)))])
     else:
-        return []
-
-    text = normalize_text(raw)
-    triples = chunk_text_by_chars(text, chunk_size=900, chunk_overlap=150)
-
-    out: List[Chunk] = []
-    for i, (st, ed, ck) in enumerate(triples):
-        # 轻量“行号”估算：按 chunk 内 \n 计数
-        # （足够满足 M1 的引用需求）
-        line_start = text[:st].count("\n") + 1
-        line_end = text[:ed].count("\n") + 1
-
-        # pdf 页码：若文本含 [PAGE n]，可粗略定位；这里先不强求准确
-        out.append(
-            Chunk(
+        return
+
+    chunk_id = 0
+    char_base = 0
+    line_base = 0
+    for page_no, text in sections:
+        if not text:
+            continue
+        triples = chunk_text_by_chars(text, chunk_size=900, chunk_overlap=150)
+
+        # 所有换行符的位置只扫一遍，之后每个 chunk 二分查找
+        nl_pos = [m.start() for m in re.finditer("\n", text)]
+
+        for st, ed, ck in triples:
+            # 轻量“行号”估算：st/ed 之前的 \n 个数 + 1
+            # （足够满足 M1 的引用需求）
+            line_start = line_base + bisect.bisect_left(nl_pos, st) + 1
+            line_end = line_base + bisect.bisect_left(nl_pos, ed) + 1
+
+            yield Chunk(
                 doc_id=doc_id,
                 doc_path=path,
                 doc_type=doc_type,
-                chunk_id=i,
+                chunk_id=chunk_id,
                 text=ck,
-                start_char=st,
-                end_char=ed,
-                page_start=None,
-                page_end=None,
+                start_char=char_base + st,
+                end_char=char_base + ed,
+                page_start=page_no,
+                page_end=page_no,
                 line_start=line_start,
                 line_end=line_end,
             )
-        )
-    return out
+            chunk_id += 1
+
+        char_base += len(text) + 1
+        line_base += len(nl_pos) + 1
+
+
+def build_chunks_for_file(path: str) -> List[Chunk]:
+    return list(iter_chunks_for_file(path))
@@ -0,0 +1,20 @@
+# gunicorn 配置：gunicorn -c gunicorn.conf.py Flask:app
+# （gunicorn 不支持 Windows；Windows 本机调试仍用 python Flask.py）
+import multiprocessing
+
+bind = "0.0.0.0:5000"
+
+# FAISS search 内部会释放 GIL，线程能真正并行
+worker_class = "gthread"
+workers = 2 * multiprocessing.cpu_count() + 1
+threads = 8
+
+# 每个 worker 已有多个线程，FAISS 的 OpenMP 再按核数开线程会严重超订；
+# 在 preload 之前设置，Flask.py 在 import 时读取
+raw_env = ["FAISS_OMP_THREADS=1"]
+
+# 在 master 里先 import Flask.py（建好 FAISS 索引）再 fork，
+# 子进程以写时复制共享索引内存，而不是每个 worker 各建一份
+preload_app = True
+
+timeout = 60
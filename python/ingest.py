@@ -1,10 +1,15 @@
 import argparse
 import os
-from typing import List
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
 
-from SQLite import connect, init_schema, clear_doc, insert_chunks, build_chunks_for_file, fetch_all_chunks
+from SQLite import Chunk, connect, init_schema, clear_doc, insert_chunks, build_chunks_for_file, iter_chunks_for_file, fetch_all_chunks
 from BM25 import build_bm25_from_sql_rows
 
+# 每个 worker 最多预取的文件数
+IN_FLIGHT_PER_WORKER = 2
+
 
 def list_docs(docs_dir: str) -> List[str]:
     exts = {".pdf", ".txt", ".md"}
@@ -17,13 +22,47 @@ def list_docs(docs_dir: str) -> List[str]:
     return sorted(out)
 
 
+def iter_file_chunks(docs: List[str], workers: Optional[int]) -> Iterator[Tuple[str, Iterable[Chunk]]]:
+    """
+    按文件并行做 PDF 抽取 / 规范化 / 切块（文件之间互不相关），结果按 docs 顺序产出；
+    写库仍在主进程串行完成（SQLite 单写者）。只有一个文件或 workers=1 时不起进程池。
+    同时在途的文件最多 IN_FLIGHT_PER_WORKER * workers 个：写库跟不上或前面有大文件时，
+    已切好的 chunk 列表不会无限堆在主进程内存里。
+    """
+    if workers == 1 or len(docs) <= 1:
+        for p in docs:
+            yield p, iter_chunks_for_file(p)
+        return
+    workers = workers or os.cpu_count() or 1
+    window = IN_FLIGHT_PER_WORKER * workers
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for p in docs:
+            pending.append((p, pool.submit(build_chunks_for_file, p)))
+            if len(pending) >= window:
+                head, fut = pending.popleft()
+                yield head, fut.result()
+        while pending:
+            head, fut = pending.popleft()
+            yield head, fut.result()
+
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--docs_dir", required=True)
     ap.add_argument("--db", required=True)
     ap.add_argument("--bm25", required=True)
-    ap.add_argument("--rebuild", action="store_true", help="rebuild chunks for all docs")
+    ap.add_argument("--rebuild", action="store_true", help="deprecated, no effect: every run re-chunks all docs")
+    ap.add_argument("--workers", type=int, default=None, help="chunking/tokenizing processes (default: CPU count)")
     args = ap.parse_args()
+    if args.workers is not None and args.workers < 1:
+        ap.error("--workers must be >= 1")
+
+    # 旧版本的 --bm25 是单个 pickle 文件；在切块/写库之前就报错，别等到 save 时才失败
+    if os.path.isfile(args.bm25):
+        raise NotADirectoryError(
+            f"BM25 index {args.bm25} is a legacy single-file pickle; pass a directory or delete it and re-run ingest.py"
+        )
 
     conn = connect(args.db)
     init_schema(conn)
@@ -33,20 +72,23 @@ def main():
         print(f"[ingest] no docs found in {args.docs_dir}")
         return
 
-    for p in docs:
-        if args.rebuild:
-            clear_doc(conn, p)
-        chunks = build_chunks_for_file(p)
-        if not chunks:
-            print(f"[ingest] skip unsupported/empty: {p}")
-            continue
+    # 整次 ingest 一个事务，只在最后 commit 一次（避免每个文件两次 fsync）
+    conn.execute("BEGIN IMMEDIATE")
+    for p, chunks in iter_file_chunks(docs, args.workers):
         # 为简单起见：每次都先清空再插（避免重复）
-        clear_doc(conn, p)
-        insert_chunks(conn, chunks)
-        print(f"[ingest] {os.path.basename(p)} -> chunks={len(chunks)}")
+        n_cleared = clear_doc(conn, p, commit=False)
+        n_chunks = insert_chunks(conn, chunks, commit=False)
+        if not n_chunks:
+            if n_cleared:
+                print(f"[ingest] no chunks, cleared {n_cleared} old rows: {p}")
+            else:
+                print(f"[ingest] skip unsupported/empty: {p}")
+            continue
+        print(f"[ingest] {os.path.basename(p)} -> chunks={n_chunks}")
+    conn.commit()
 
     rows = fetch_all_chunks(conn)
-    bm25_index = build_bm25_from_sql_rows(rows)
+    bm25_index = build_bm25_from_sql_rows(rows, workers=args.workers)
     os.makedirs(os.path.dirname(args.bm25), exist_ok=True)
     bm25_index.save(args.bm25)
     print(f"[ingest] bm25 saved: {args.bm25}, total_chunks={len(rows)}")
@@ -1,30 +1,45 @@
 import argparse
 import os
 import sqlite3
-import subprocess
-from typing import List, Tuple
+from pathlib import Path
+from typing import Dict, List, Tuple
 
 from BM25 import BM25Index, search as bm25_search
+from LLM import get_server
+
+
+# db_path -> 常驻只读连接（同一进程内多次检索复用，不再每次 connect）
+_CONNS: Dict[str, sqlite3.Connection] = {}
+
+
+def _get_conn(db_path: str) -> sqlite3.Connection:
+    conn = _CONNS.get(db_path)
+    if conn is None:
+        # as_uri() 会对路径做百分号编码，路径里的 # ? % 不会截断 URI 参数
+        uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        conn.execute("PRAGMA temp_store=MEMORY;")
+        conn.execute("PRAGMA cache_size=-200000;")
+        conn.execute("PRAGMA mmap_size=268435456;")
+        _CONNS[db_path] = conn
+    return conn
 
 
 def sqlite_fetch_by_ids(db_path: str, ids: List[int]) -> List[Tuple]:
-    conn = sqlite3.connect(db_path)
-    cur = conn.cursor()
-    q = ",".join(["?"] * len(ids))
-    cur.execute(
+    if not ids:
+        return []
+    # 用 VALUES 带上序号，让 SQLite 直接按 ids 的顺序返回
+    values = ",".join(f"({i},?)" for i in range(len(ids)))
+    cur = _get_conn(db_path).execute(
         f"""
-        SELECT id, doc_id, doc_path, chunk_id, text, line_start, line_end
-        FROM documents
-        WHERE id IN ({q})
+        WITH ids(i, id) AS (VALUES {values})
+        SELECT d.id, d.doc_id, d.doc_path, d.chunk_id, d.text, d.line_start, d.line_end
+        FROM ids JOIN documents d ON d.id = ids.id
+        ORDER BY ids.i
         """,
         ids,
     )
-    rows = cur.fetchall()
-    conn.close()
-
-    # 保持与 ids 顺序一致
-    mp = {int(r[0]): r for r in rows}
-    return [mp[i] for i in ids if i in mp]
+    return cur.fetchall()
 
 
 def build_context_with_citations(rows: List[Tuple]) -> str:
@@ -61,28 +76,20 @@ def build_prompt(question: str, evidence: str) -> str:
 
 
 def run_llm_cli(llm_exe: str, model_path: str, prompt: str) -> str:
-    # 通过 --prompt 传入（注意 Windows 引号由 subprocess 处理）
-    cmd = [
+    # 常驻 llm_cli（--server-stdio），模型只加载一次，多次调用复用
+    server = get_server(
         llm_exe,
-        "--model", model_path,
-        "--prompt", prompt,
-        "--n", "256",
-        "--temp", "0.2",
-        "--topk", "40",
-        "--topp", "0.9",
-        "--seed", "42",
-    ]
-    p = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="ignore")
-    # 你的 llm_cli 会打印 --- model output --- ... --- end ---
-    out = (p.stdout or "") + ("\n" + p.stderr if p.stderr else "")
-    return out.strip()
+        model_path,
+        ["--temp", "0.2", "--topk", "40", "--topp", "0.9", "--seed", "42"],
+    )
+    return server.generate(prompt, n=256).strip()
 
 
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--question", required=True)
     ap.add_argument("--db", default="data/documents.db")
-    ap.add_argument("--bm25", default="data/bm25.pkl")
+    ap.add_argument("--bm25", default="data/bm25")
     ap.add_argument("--topk", type=int, default=5)
     ap.add_argument("--llm_exe", required=True)
     ap.add_argument("--model", required=True)
@@ -90,6 +97,10 @@ def main():
 
     if not os.path.exists(args.bm25):
         raise FileNotFoundError(f"BM25 index not found: {args.bm25}, run ingest.py first")
+    if os.path.isfile(args.bm25):
+        raise NotADirectoryError(
+            f"BM25 index {args.bm25} is a legacy single-file pickle; pass a directory or delete it and re-run ingest.py"
+        )
     if not os.path.exists(args.db):
         raise FileNotFoundError(f"SQLite db not found: {args.db}, run ingest.py first")
 
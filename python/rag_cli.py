@@ -4,18 +4,22 @@ from __future__ import annotations
 import json
 import re
 import sqlite3
-import subprocess
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Set, Tuple
+
+import numpy as np
 
 from retrieval_bm25 import BM25Index, tokenize
 from db import DB_PATH
+from LLM import get_server
 
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
 LLM_EXE = PROJECT_ROOT / "build" / "Release" / "llm_cli.exe"
 MODEL = PROJECT_ROOT / "models" / "qwen2.5-3b-instruct-q5_k_m.gguf"
 
 TOPK = 5
+QUERY_CACHE_SIZE = 256
 
 # =========================
 # 阀门（偏宽松，但保证不乱答）
@@ -47,9 +51,8 @@ def call_llm(prompt: str) -> str:
     if not MODEL.exists():
         raise RuntimeError(f"找不到模型: {MODEL}")
 
-    cmd = [str(LLM_EXE), "-m", str(MODEL), "-p", prompt]
-    r = subprocess.run(cmd, capture_output=True, text=True, encoding="utf-8", errors="ignore")
-    raw = ((r.stdout or "") + "\n" + (r.stderr or "")).strip()
+    # 常驻 llm_cli 子进程：只在第一次调用时加载模型
+    raw = get_server(LLM_EXE, MODEL).generate(prompt)
     return extract_model_output(raw)
 
 def save_run(query: str, topk: int, chunk_ids: List[int], prompt: str, answer: str):
@@ -61,18 +64,21 @@ def save_run(query: str, topk: int, chunk_ids: List[int], prompt: str, answer: s
     conn.commit()
     conn.close()
 
-def normalize(scores: List[float]) -> List[float]:
-    if not scores:
-        return []
-    mx = max(scores)
+def normalize(scores: np.ndarray) -> np.ndarray:
+    if scores.size == 0:
+        return scores
+    mx = scores.max()
     if mx <= 0:
-        return [0.0 for _ in scores]
-    return [s / mx for s in scores]
+        return np.zeros_like(scores)
+    return scores / mx
+
+def hit_tokset(h: Dict) -> Set[str]:
+    # 每个 hit 只分词一次，coverage / 硬术语检查都复用这个集合
+    return set(tokenize((h.get("text") or "").lower()))
 
-def token_coverage(q_tokens: List[str], text: str) -> float:
+def token_coverage(q_tokens: List[str], text_tokset: Set[str]) -> float:
     if not q_tokens:
         return 0.0
-    t = (text or "").lower()
     hit, total = 0, 0
     for tok in q_tokens:
         tok = (tok or "").strip().lower()
@@ -82,7 +88,7 @@ def token_coverage(q_tokens: List[str], text: str) -> float:
         if len(tok) == 1 and re.fullmatch(r"[\u4e00-\u9fff]", tok):
             continue
         total += 1
-        if tok in t:
+        if tok in text_tokset:
             hit += 1
     return (hit / total) if total else 0.0
 
@@ -93,8 +99,13 @@ def query_hard_terms(q: str) -> List[str]:
 def evidence_has_terms(hits: List[Dict], terms: List[str]) -> bool:
     if not terms:
         return True
+    # 先查预先建好的 token 集合；std::format 这类不是单个 token 的术语（或只出现在标题里）再退回子串查找
+    toks: Set[str] = set().union(*(h.get("_tokset", ()) for h in hits))
+    missing = [t for t in terms if t not in toks]
+    if not missing:
+        return True
     blob = "\n".join([(h.get("title","") + "\n" + h.get("text","")).lower() for h in hits])
-    return all(t in blob for t in terms)  # 注意：这里用 all，更严格（问 flask 就得真有 flask）
+    return all(t in blob for t in missing)  # 注意：这里用 all，更严格（问 flask 就得真有 flask）
 
 def title_hit(q_tokens: List[str], title: str) -> bool:
     tl = (title or "").lower()
@@ -156,8 +167,41 @@ def fallback_excerpt_answer(query: str, hits: List[Dict]) -> str:
         f"{snippet}"
     )
 
+def rank_hits(bm25: BM25Index, q: str, topk: int) -> Tuple[Dict, ...]:
+    """
+    BM25 检索 + coverage / 标题命中重打分，按 final 降序返回（tuple，便于缓存）
+    """
+    hits = bm25.search(q, topk)
+    qtok = tokenize(q)
+
+    n = len(hits)
+    toksets = [hit_tokset(h) for h in hits]
+    bm25_norm = normalize(
+        np.fromiter((float(h.get("score", 0.0)) for h in hits), dtype=np.float32, count=n)
+    )
+    cov = np.fromiter((token_coverage(qtok, ts) for ts in toksets), dtype=np.float32, count=n)
+    th = np.fromiter(
+        (1.0 if title_hit(qtok, h.get("title", "")) else 0.0 for h in hits),
+        dtype=np.float32,
+        count=n,
+    )
+    # final：BM25 为主，覆盖率辅助，标题命中加一点
+    final = 0.75 * bm25_norm + 0.25 * cov + 0.08 * th
+
+    # 稳定排序：同分时保持 BM25 原顺序
+    enriched: List[Dict] = []
+    for i in np.argsort(-final, kind="stable"):
+        hh = dict(hits[i])
+        hh["_tokset"] = toksets[i]
+        hh["cov"] = float(cov[i])
+        hh["final"] = float(final[i])
+        enriched.append(hh)
+    return tuple(enriched)
+
 def main():
     bm25 = BM25Index()
+    # 查询缓存绑定在这个 index 对象上：同一会话里重复的 Query 直接复用检索+打分结果
+    cached_rank_hits = lru_cache(maxsize=QUERY_CACHE_SIZE)(partial(rank_hits, bm25))
 
     while True:
         q = input("Query> ").strip()
@@ -166,25 +210,8 @@ def main():
         if q.lower() in {"exit", "quit"}:
             break
 
-        hits = bm25.search(q, TOPK)
         qtok = tokenize(q)
-
-        bm25_scores = [float(h.get("score", 0.0)) for h in hits]
-        bm25_norm = normalize(bm25_scores)
-
-        enriched: List[Dict] = []
-        for i, h in enumerate(hits):
-            cov = token_coverage(qtok, h.get("text", ""))
-            th = 1.0 if title_hit(qtok, h.get("title", "")) else 0.0
-            # final：BM25 为主，覆盖率辅助，标题命中加一点
-            final = 0.75 * (bm25_norm[i] if i < len(bm25_norm) else 0.0) + 0.25 * cov + 0.08 * th
-
-            hh = dict(h)
-            hh["cov"] = cov
-            hh["final"] = final
-            enriched.append(hh)
-
-        enriched.sort(key=lambda x: x.get("final", 0.0), reverse=True)
+        enriched = list(cached_rank_hits(q, TOPK))
 
         print("\n=== HITS ===")
         for h in enriched: